@@ -1,16 +1,19 @@
 import streamlit as st
+from datetime import datetime
 from pathlib import Path
+import threading
 import time
 from typing import List, Dict, Any
 
 from src.ingest import load_documents, chunk_documents
+from src.ingest_cache import IngestManifest
 from src.retriever import build_or_load_vectorstore, retrieve_context
-from src.quiz_engine import generate_quiz
-from src.evaluation import grade_answer
-from src.memory import JsonMemory
+from src.quiz_engine import MAX_EXCLUDED_PROMPTS, generate_quiz
+from src.evaluation import grade_answers_batch, prewarm, stream_grade_answer
+from src.sqlite_memory import SqliteMemory
 
 NOTES_DIR = Path("data/notes")
-PROGRESS_PATH = Path("progress.json")
+PROGRESS_PATH = Path("progress.db")
 
 
 def ensure_notes_dir() -> None:
@@ -24,11 +27,12 @@ def save_uploaded_files(files: List[st.runtime.uploaded_file_manager.UploadedFil
         dest = NOTES_DIR / uf.name
         dest.write_bytes(uf.getbuffer())
         saved.append(dest)
+    _scan_notes.clear()
     return saved
 
 
-def list_notes() -> List[Dict[str, Any]]:
-    ensure_notes_dir()
+@st.cache_data(ttl=30)
+def _scan_notes(dir_mtime: float) -> List[Dict[str, Any]]:
     rows: List[Dict[str, Any]] = []
     for p in sorted(NOTES_DIR.rglob("*")):
         if p.is_file() and p.suffix.lower() in {".pdf", ".txt", ".md"}:
@@ -37,17 +41,37 @@ def list_notes() -> List[Dict[str, Any]]:
                 rows.append({
                     "file": str(p.relative_to(NOTES_DIR)),
                     "size_kb": int(round(stat.st_size / 1024)),
-                    "modified": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat.st_mtime)),
+                    # Raw timestamp; the dataframe column formats it at display time
+                    "modified": datetime.fromtimestamp(stat.st_mtime),
                 })
             except Exception:
                 rows.append({"file": str(p.relative_to(NOTES_DIR)), "size_kb": None, "modified": None})
     return rows
 
 
+def list_notes() -> List[Dict[str, Any]]:
+    # Rescan only when the notes folder changes (or the TTL lapses), not on every rerun
+    ensure_notes_dir()
+    return _scan_notes(NOTES_DIR.stat().st_mtime)
+
+
+@st.cache_resource
+def _load_vectorstore():
+    # One handle for the server's lifetime, shared by all sessions
+    return build_or_load_vectorstore([])
+
+
 def ensure_vectorstore_loaded() -> None:
     if "vs" not in st.session_state:
         # Load existing vectorstore if present
-        st.session_state.vs = build_or_load_vectorstore([])
+        st.session_state.vs = _load_vectorstore()
+
+
+def _memory() -> SqliteMemory:
+    # One store per session: avoids reopening the database in every handler
+    if "memory" not in st.session_state:
+        st.session_state.memory = SqliteMemory(str(PROGRESS_PATH))
+    return st.session_state.memory
 
 
 def reset_quiz_state() -> None:
@@ -64,11 +88,12 @@ def reset_quiz_state() -> None:
     st.session_state.last_took_ms = 0
     st.session_state.last_q = None
     st.session_state.busy = False
+    st.session_state.rendered = {}
 
 
 def start_quiz(topic: str, n: int, avoid_mode: str, feedback_mode: str) -> None:
     ensure_vectorstore_loaded()
-    memory = JsonMemory(str(PROGRESS_PATH))
+    memory = _memory()
 
     # Retrieve context
     ctx = retrieve_context(st.session_state.vs, topic, k=6)
@@ -77,7 +102,7 @@ def start_quiz(topic: str, n: int, avoid_mode: str, feedback_mode: str) -> None:
         return
 
     # Exclusions & difficulty
-    excluded = memory.get_excluded_prompts(mode=avoid_mode, topic=topic)
+    excluded = memory.get_excluded_prompts(mode=avoid_mode, topic=topic, limit=MAX_EXCLUDED_PROMPTS)
     difficulty = memory.get_adaptive_difficulty(topic)
 
     # Generate quiz
@@ -105,6 +130,7 @@ def start_quiz(topic: str, n: int, avoid_mode: str, feedback_mode: str) -> None:
     st.session_state.last_took_ms = 0
     st.session_state.last_q = None
     st.session_state.busy = False
+    st.session_state.rendered = {}
 
 
 def render_question(i: int, q: Dict[str, Any]) -> str:
@@ -113,13 +139,14 @@ def render_question(i: int, q: Dict[str, Any]) -> str:
     # Disable inputs if busy or feedback already exists for this question
     disabled = st.session_state.busy or (st.session_state.feedbacks[i] is not None)
     if q.get("type") == "mcq":
-        options = q.get("options", [])
         placeholder = "— Select an option —"
-        choices = [placeholder] + options
-        if answer in options:
-            idx = choices.index(answer)
-        else:
-            idx = 0
+        # Build choices and an option -> index map once per question, not on every rerun
+        rendered = st.session_state.setdefault("rendered", {})
+        if i not in rendered:
+            choices = [placeholder] + q.get("options", [])
+            rendered[i] = (choices, {opt: n for n, opt in enumerate(choices) if n > 0})
+        choices, index_map = rendered[i]
+        idx = index_map.get(answer, 0)
         selected = st.radio("Choose an option:", choices, index=idx, key=f"mcq_{i}", disabled=disabled)
         return "" if selected == placeholder else selected
     else:
@@ -138,19 +165,30 @@ def render_feedback(i: int, q: Dict[str, Any], result: Dict[str, Any], took_ms:
         st.caption(f"Correct answer: {q.get('answer','')}")
 
 
-def grade_and_log(i: int, q: Dict[str, Any], student_answer: str, took_ms: int) -> Dict[str, Any]:
-    result = grade_answer(q['prompt'], q['answer'], student_answer)
-    memory = JsonMemory(str(PROGRESS_PATH))
-    memory.log_attempt(
+def log_graded(q: Dict[str, Any], student_answer: str, took_ms: int, result: Dict[str, Any]) -> None:
+    _memory().log_attempt(
         topic=st.session_state.topic,
         prompt=q['prompt'],
         student_answer=student_answer,
         correct=bool(result.get('correct')),
         response_ms=took_ms,
     )
+
+
+def grade_and_log(i: int, q: Dict[str, Any], student_answer: str, took_ms: int) -> Dict[str, Any]:
+    # Stream the feedback onto the page while the model writes it
+    result: Dict[str, Any] = {}
+    st.write_stream(stream_grade_answer(q['prompt'], q['answer'], student_answer, result, q.get('type', 'short')))
+    log_graded(q, student_answer, took_ms, result)
     return result
 
 
+def grade_all(questions: List[Dict[str, Any]], answers: List[str]) -> List[Dict[str, Any]]:
+    """Grade every answer in one batched LLM call."""
+    items = [(q['prompt'], q['answer'], answers[j]) for j, q in enumerate(questions)]
+    return grade_answers_batch(items, q_types=[q.get('type', 'short') for q in questions])
+
+
 def quiz_tab():
     st.subheader("Quiz")
     quiz_started = st.session_state.get("quiz_started", False)
@@ -197,6 +235,11 @@ def quiz_tab():
         # Render question and input
         if st.session_state.q_start is None and st.session_state.feedbacks[i] is None:
             st.session_state.q_start = time.perf_counter()
+            # Warm the grader's connection while the student is still thinking. This block runs once
+            # per question shown (q_start is cleared on Next/Finish), so a connection that expired
+            # during a previous question is reopened. MCQs are graded locally and need none.
+            if q.get("type") != "mcq":
+                threading.Thread(target=prewarm, daemon=True).start()
         student_answer = render_question(i, q)
         st.session_state.answers[i] = student_answer
 
@@ -267,9 +310,10 @@ def quiz_tab():
                         # Record time for last question
                         took_ms = int(round((time.perf_counter() - st.session_state.q_start) * 1000))
                         st.session_state.response_ms[i] = took_ms
-                        # Grade all now
-                        for j, qj in enumerate(questions):
-                            res = grade_and_log(j, qj, st.session_state.answers[j], st.session_state.response_ms[j])
+                        # Grade all now (one batched call), then log in question order
+                        results = grade_all(questions, st.session_state.answers)
+                        for j, (qj, res) in enumerate(zip(questions, results)):
+                            log_graded(qj, st.session_state.answers[j], st.session_state.response_ms[j], res)
                             st.session_state.feedbacks[j] = res
                             if bool(res.get("correct")):
                                 st.session_state.correct_count += 1
@@ -291,7 +335,7 @@ def finish_quiz() -> None:
         st.info("Good progress: you’re ready for more challenging, reasoning-based questions.")
 
     # Save session
-    memory = JsonMemory(str(PROGRESS_PATH))
+    memory = _memory()
     try:
         memory.log_session(
             topic=st.session_state.topic,
@@ -303,7 +347,7 @@ def finish_quiz() -> None:
                 "feedback_mode": st.session_state.feedback_mode,
             },
         )
-        st.caption("Progress saved to progress.json")
+        st.caption("Progress saved to progress.db")
     except Exception as e:
         st.warning(f"Could not save progress: {e}")
 
@@ -313,20 +357,22 @@ def upload_tab():
     st.write("Upload PDF, TXT, or MD files to include in your study notes.")
     files = st.file_uploader("Upload files", type=["pdf", "txt", "md"], accept_multiple_files=True)
     if files:
-        # Build a signature of current upload set (name + size) to avoid repeated rebuilds on rerun
-        try:
-            sig = tuple(sorted((f.name, len(f.getbuffer())) for f in files))
-        except Exception:
-            sig = tuple(sorted((f.name, 0) for f in files))
+        # Build a signature of current upload set (name + size) to avoid repeated rebuilds on rerun;
+        # UploadedFile.size is metadata, so no file contents are touched here
+        sig = tuple(sorted((f.name, f.size) for f in files))
         if st.session_state.get("last_upload_sig") != sig:
             saved = save_uploaded_files(files)
-            with st.spinner("Rebuilding vector store..."):
-                docs = load_documents(str(NOTES_DIR))
+            with st.spinner("Updating vector store..."):
+                # Only new or changed files are re-embedded
+                manifest = IngestManifest()
+                docs = load_documents(str(NOTES_DIR), manifest=manifest)
                 chunks = chunk_documents(docs)
-                st.session_state.vs = build_or_load_vectorstore(chunks)
+                st.session_state.vs = build_or_load_vectorstore(chunks, manifest=manifest)
+            # Other sessions pick up the updated store on their next load
+            _load_vectorstore.clear()
             st.session_state.last_upload_sig = sig
             st.session_state.vs_built_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            st.success(f"Uploaded {len(saved)} files. Vector store rebuilt.")
+            st.success(f"Uploaded {len(saved)} files. Vector store updated.")
             st.balloons()
         else:
             st.caption("These uploads have already been processed.")
@@ -335,7 +381,11 @@ def upload_tab():
     notes = list_notes()
     st.write("### Current notes on disk")
     if notes:
-        st.dataframe(notes, use_container_width=True)
+        st.dataframe(
+            notes,
+            use_container_width=True,
+            column_config={"modified": st.column_config.DatetimeColumn("modified", format="YYYY-MM-DD HH:mm:ss")},
+        )
     else:
         st.caption("No notes found yet in data/notes.")
 
@@ -344,15 +394,24 @@ def upload_tab():
         st.caption(f"Vector store last built at: {st.session_state.vs_built_at}")
 
 
+@st.cache_data(ttl=5)
+def _load_sessions(_memory: SqliteMemory, progress_mtime: float) -> List[Dict[str, Any]]:
+    return _memory.get_sessions()
+
+
+def _progress_mtime() -> float:
+    # In WAL mode new rows land in the -wal file until a checkpoint, so watch both files
+    wal = PROGRESS_PATH.with_name(PROGRESS_PATH.name + "-wal")
+    return max((p.stat().st_mtime for p in (PROGRESS_PATH, wal) if p.exists()), default=0.0)
+
+
 def progress_tab():
     st.subheader("Progress")
-    memory = JsonMemory(str(PROGRESS_PATH))
+    memory = _memory()
     try:
-        data = memory._read()
+        sessions = _load_sessions(memory, _progress_mtime())
     except Exception:
-        data = {"sessions": [], "attempts": [], "questions": {}}
-
-    sessions = data.get("sessions", [])
+        sessions = []
 
     st.write("### Sessions")
     if sessions:
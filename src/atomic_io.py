@@ -0,0 +1,23 @@
+import os
+from pathlib import Path
+
+
+def atomic_write_bytes(path, data: bytes) -> None:
+    """Replace 'path' with 'data' durably: after a crash or power loss it holds the old or the new content.
+
+    The data is written to a temp file and fsynced before the rename, and the directory is fsynced
+    after it, so callers may rely on the new file being on disk once this returns.
+    """
+    path = Path(path)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if hasattr(os, "O_DIRECTORY"):  # not on Windows, where directories cannot be opened
+        fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
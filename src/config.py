@@ -6,6 +6,8 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-mini")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Max grading requests in flight at once when answers are graded concurrently
+GRADE_CONCURRENCY = int(os.getenv("GRADE_CONCURRENCY", "6"))
 
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY is missing. Set it in .env")
\ No newline at end of file
@@ -0,0 +1,78 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import orjson
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS grades (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL
+);
+"""
+
+
+def grade_key(model: str, prompt_id: str, question: str, reference_answer: str, student_answer: str) -> str:
+    """Content address for a grading request; 'prompt_id' identifies the grading instructions."""
+    payload = f"{model}|{prompt_id}|{question}|{reference_answer}|{student_answer}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GradeCache:
+    """Persistent key -> grade result map backed by SQLite in WAL mode.
+
+    A write inserts only the new grades, so its cost does not grow with the cache, and the app and
+    the CLI share one store instead of overwriting each other's copy. Holds at most 'max_entries'
+    grades; the least recently written are evicted first.
+    """
+
+    def __init__(self, path="cache/grades.db", max_entries: int = 5000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Used from Streamlit's script threads and grading threads; access is serialized by _lock
+        self._conn = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM grades WHERE key = ?", (key,)).fetchone()
+        return orjson.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, result: Dict[str, Any]) -> None:
+        self.set_many({key: result})
+
+    def set_many(self, results: Dict[str, Dict[str, Any]]) -> None:
+        """Store several grades in one transaction."""
+        if not results:
+            return
+        rows = [(key, orjson.dumps(result).decode("utf-8")) for key, result in results.items()]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # REPLACE re-inserts an existing key with a new rowid: rowid order is write order
+                self._conn.executemany("INSERT OR REPLACE INTO grades (key, result) VALUES (?, ?)", rows)
+                self._conn.execute(
+                    "DELETE FROM grades WHERE rowid <= "
+                    "(SELECT rowid FROM grades ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+_cache: Optional[GradeCache] = None
+
+
+def get_grade_cache() -> GradeCache:
+    global _cache
+    if _cache is None:
+        _cache = GradeCache()
+    return _cache
@@ -1,18 +1,61 @@
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from typing import List, Optional
+from langchain_text_splitters import TokenTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
 from langchain.schema import Document
+from .ingest_cache import IngestManifest
 
-def load_documents(notes_dir: str) -> List[Document]:
-    docs = []
-    for p in Path(notes_dir).glob("**/*"):
-        if p.suffix.lower() in [".pdf"]:
-            docs.extend(PyPDFLoader(str(p)).load())
-        elif p.suffix.lower() in [".txt", ".md"]:
-            docs.extend(TextLoader(str(p), encoding="utf-8").load())
-    return docs
-
-def chunk_documents(docs: List[Document], chunk_size=1200, chunk_overlap=150) -> List[Document]:
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    return splitter.split_documents(docs)
\ No newline at end of file
+SUPPORTED_SUFFIXES = {".pdf", ".txt", ".md"}
+
+
+def _load_text(path: str) -> List[Document]:
+    """Decode a text note straight from a read-only memory map, without an intermediate bytes copy."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            text = ""  # mmap cannot map an empty file
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                text = str(mm, "utf-8", "replace")
+    return [Document(page_content=text, metadata={"source": path})]
+
+
+def _load_one(path: str) -> List[Document]:
+    """Load a single file; top-level so it can run in a worker process."""
+    if path.lower().endswith(".pdf"):
+        return PyPDFLoader(path).load()
+    return _load_text(path)
+
+
+def load_documents(notes_dir: str, manifest: Optional[IngestManifest] = None) -> List[Document]:
+    """Load every note file, or only new/changed ones when a manifest is given."""
+    paths = sorted(
+        str(p) for p in Path(notes_dir).rglob("*")
+        if p.suffix.lower() in SUPPORTED_SUFFIXES and p.is_file()
+    )
+    if manifest is not None:
+        paths = [p for p in paths if not manifest.is_current(p)]
+    if len(paths) <= 1:
+        return [d for p in paths for d in _load_one(p)]
+    # PDF parsing is CPU-bound: spread files across processes rather than threads
+    with ProcessPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1)) as ex:
+        results = list(ex.map(_load_one, paths))
+    return [d for docs in results for d in docs]
+
+
+def chunk_documents(docs: List[Document], chunk_size=300, chunk_overlap=40) -> List[Document]:
+    """Split into windows of 'chunk_size' tokens (cl100k_base) overlapping by 'chunk_overlap'.
+
+    The defaults match the former 1200/150-character windows at ~4 characters per token, so the
+    k retrieved chunks sent to quiz generation stay the same size.
+    """
+    # tiktoken's BPE runs in Rust; notes that happen to contain special-token text are split as plain text
+    splitter = TokenTextSplitter(
+        encoding_name="cl100k_base",
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        disallowed_special=(),
+    )
+    return splitter.split_documents(docs)
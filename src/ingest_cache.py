@@ -0,0 +1,79 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+from .atomic_io import atomic_write_bytes
+
+
+class IngestManifest:
+    """Record of which note files are embedded in the vector store, and under which chunk ids.
+
+    Each entry maps a file path to {mtime, sha1, chunk_ids}. A file whose mtime is unchanged,
+    or whose content hash is unchanged, does not need to be embedded again.
+    """
+
+    def __init__(self, path="vectorstore/ingest.json"):
+        self.path = Path(path)
+        self.is_new = not self.path.exists()
+        self._files: Dict[str, Dict[str, Any]] = {}
+        if not self.is_new:
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                if isinstance(data, dict):
+                    self._files = data
+            except Exception:
+                self.is_new = True
+        self._pending: Dict[str, Tuple[float, str]] = {}
+        self._seen: Set[str] = set()
+
+    def is_current(self, path: str) -> bool:
+        """True if 'path' is already embedded as-is; otherwise mark it pending."""
+        self._seen.add(path)
+        p = Path(path)
+        mtime = p.stat().st_mtime
+        rec = self._files.get(path)
+        if rec is not None and rec.get("mtime") == mtime:
+            return True
+        sha1 = hashlib.sha1(p.read_bytes()).hexdigest()
+        if rec is not None and rec.get("sha1") == sha1:
+            # Touched but not modified
+            rec["mtime"] = mtime
+            return True
+        self._pending[path] = (mtime, sha1)
+        return False
+
+    def pending(self) -> List[str]:
+        """Paths seen by is_current that are new or changed."""
+        return list(self._pending)
+
+    def removed(self) -> List[str]:
+        """Tracked paths that were not seen in the last scan."""
+        return [p for p in self._files if p not in self._seen]
+
+    def reset(self) -> None:
+        """Forget every tracked file, so the next sync clears the collection and embeds all notes again."""
+        self._files = {}
+        self.is_new = True
+
+    def chunk_ids(self, path: str) -> List[str]:
+        rec = self._files.get(path)
+        return list(rec.get("chunk_ids", [])) if rec else []
+
+    def new_chunk_ids(self, path: str, count: int) -> List[str]:
+        """Deterministic ids for the chunks of a pending file."""
+        _, sha1 = self._pending[path]
+        prefix = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+        return [f"{prefix}-{sha1[:16]}-{n}" for n in range(count)]
+
+    def record(self, path: str, chunk_ids: List[str]) -> None:
+        mtime, sha1 = self._pending.pop(path)
+        self._files[path] = {"mtime": mtime, "sha1": sha1, "chunk_ids": list(chunk_ids)}
+
+    def forget(self, path: str) -> None:
+        self._files.pop(path, None)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(self.path, json.dumps(self._files, indent=2, ensure_ascii=False).encode("utf-8"))
+        self.is_new = False
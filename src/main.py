@@ -1,10 +1,11 @@
 import argparse, sys
 from pathlib import Path
 from .ingest import load_documents, chunk_documents
+from .ingest_cache import IngestManifest
 from .retriever import build_or_load_vectorstore, retrieve_context
-from .quiz_engine import generate_quiz
-from .evaluation import grade_answer
-from .memory import JsonMemory
+from .quiz_engine import MAX_EXCLUDED_PROMPTS, generate_quiz
+from .evaluation import grade_answer, grade_answers_batch
+from .sqlite_memory import SqliteMemory
 import time
 
 
@@ -34,24 +35,28 @@ def parse_args():
     return ap.parse_args()
 
 
-# --- Progress Logging (via JsonMemory) ---
+# --- Progress Logging (via SqliteMemory) ---
 
 
 def main():
     args = parse_args()
 
-    memory = JsonMemory("progress.json")
+    memory = SqliteMemory("progress.db")
 
     # Build or load vectorstore
     if args.rebuild or not Path("vectorstore").exists():
         print("Loading & chunking documents...")
-        docs = load_documents(args.docs)
+        # Rebuild through the manifest the app uses: the collection is cleared and every chunk gets
+        # a tracked id, so later incremental updates from the app can replace or remove it
+        manifest = IngestManifest()
+        manifest.reset()
+        docs = load_documents(args.docs, manifest=manifest)
         if len(docs) == 0:
             print(f"No documents found in '{args.docs}'. Put PDFs/TXT/MD there and rerun with --rebuild.")
             sys.exit(1)
         chunks = chunk_documents(docs)
         print(f"Loaded {len(docs)} docs → {len(chunks)} chunks")
-        vs = build_or_load_vectorstore(chunks)
+        vs = build_or_load_vectorstore(chunks, manifest=manifest)
         print("Vector store built.")
     else:
         vs = build_or_load_vectorstore([])  # load existing
@@ -64,7 +69,7 @@ def main():
         sys.exit(1)
 
     # Determine excluded prompts and adaptive difficulty
-    excluded_prompts = memory.get_excluded_prompts(mode=args.avoid, topic=args.topic)
+    excluded_prompts = memory.get_excluded_prompts(mode=args.avoid, topic=args.topic, limit=MAX_EXCLUDED_PROMPTS)
     difficulty = memory.get_adaptive_difficulty(args.topic)
 
     print(f"Generating quiz... (difficulty: {difficulty})")
@@ -97,7 +102,7 @@ def main():
             took_ms = int(round((end - start) * 1000))
 
             # Grade immediately and log
-            result = grade_answer(q['prompt'], q['answer'], answer)
+            result = grade_answer(q['prompt'], q['answer'], answer, q_type=q.get('type', 'short'))
             is_correct = bool(result.get('correct'))
             memory.log_attempt(
                 topic=args.topic,
@@ -130,8 +135,12 @@ def main():
             response_ms_list.append(int(round((end - start) * 1000)))
 
         print("\n=== FEEDBACK ===")
-        for i, q in enumerate(questions, 1):
-            result = grade_answer(q['prompt'], q['answer'], answers[i-1])
+        # Grade all answers in one batched call, then report in question order
+        results = grade_answers_batch(
+            [(q['prompt'], q['answer'], answers[i]) for i, q in enumerate(questions)],
+            q_types=[q.get('type', 'short') for q in questions],
+        )
+        for i, (q, result) in enumerate(zip(questions, results), 1):
             is_correct = bool(result.get('correct'))
             memory.log_attempt(
                 topic=args.topic,
@@ -174,7 +183,7 @@ def main():
         else:
             print("\nNo frequently missed questions yet for this topic.")
 
-    # Save progress using JsonMemory
+    # Save progress using SqliteMemory
     try:
         memory.log_session(
             topic=args.topic,
@@ -187,7 +196,7 @@ def main():
                 "show_missed": bool(args.missed),
             }
         )
-        print("Progress saved to progress.json")
+        print("Progress saved to progress.db")
     except Exception as e:
         print(f"Warning: could not save progress: {e}")
 
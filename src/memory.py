@@ -1,62 +1,394 @@
-import json
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+import atexit
 import hashlib
-from typing import Dict, Any, List, Optional
+import heapq
+import os
+import re
+import time
+import weakref
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+import ijson
+import orjson
+
+from .atomic_io import atomic_write_bytes
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-process use only
+    fcntl = None
+
+
+# Appended entries are fsynced in batches: every _FLUSH_EVERY entries or _FLUSH_INTERVAL_S seconds
+_FLUSH_EVERY = 16
+_FLUSH_INTERVAL_S = 2.0
+# Logs are folded into the progress.json snapshot once they exceed this many bytes
+_COMPACT_BYTES = 1 << 20
+
+_WS = re.compile(r"\s+")
+# Sort key for get_frequently_missed rows: (error_rate, attempts, avg_ms or 0, -position)
+_RANK = itemgetter(0, 1, 2, 3)
+
+
+# Instances still open, closed at interpreter exit. Weak, so the hook does not keep them alive.
+_open_memories: "weakref.WeakSet[JsonMemory]" = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_memories() -> None:
+    for mem in list(_open_memories):
+        mem.close()
+
+
+def _now_iso() -> str:
+    """Current UTC time as ISO 8601 with millisecond precision and a 'Z' suffix."""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
 
 class JsonMemory:
+    """Progress store kept in memory and persisted as a snapshot plus append-only JSONL logs.
+
+    Each attempt/session is appended as one line to '<stem>.attempts.jsonl' / '<stem>.sessions.jsonl'
+    next to 'path', so a write costs O(entry) instead of rewriting the whole history. 'path' itself
+    (progress.json) is a full snapshot, rewritten (and the logs truncated) only when the logs grow
+    past _COMPACT_BYTES and on close. On startup the snapshot is loaded and the logs replayed on top.
+
+    Both the snapshot and the logs carry a generation number ("wal_gen"; logs in a header line), so
+    logs left behind by an interrupted compaction are recognised as already covered by the snapshot.
+    A progress.json without "wal_gen" is a plain export from an older version and is imported.
+
+    Reads are served from memory. They only go back to disk when the files' (mtime, size) shows
+    that another process (a second Streamlit session, the CLI) appended to or compacted them.
+    """
+
     def __init__(self, path="progress.json"):
+        self._set_paths(path)
+        self._gen = 0
+        self._reset()
+        with self._file_lock(exclusive=True):
+            if self._attempts_path.exists() or self._sessions_path.exists():
+                self._replay()
+            elif self.path.exists():
+                self._import_export()
+            for log_path in (self._sessions_path, self._attempts_path):
+                self._trim_torn_tail(log_path)
+            self._sessions_fp = open(self._sessions_path, "ab", buffering=1 << 16)
+            self._attempts_fp = open(self._attempts_path, "ab", buffering=1 << 16)
+            self._stamp = self._log_stamp()
+        # Expected log sizes: what was on disk at the last sync plus what this instance appended
+        self._sizes = [size for _, size in self._stamp[:2]]
+        self._dirty = 0
+        # Entries appended since this instance last compacted; close() only compacts if there are any
+        self._unsnapshotted = 0
+        self._last_flush = time.monotonic()
+        self._closed = False
+        _open_memories.add(self)
+
+    def _set_paths(self, path) -> None:
         self.path = Path(path)
-        if not self.path.exists():
-            self._write({"sessions": [], "attempts": [], "questions": {}})
+        self._attempts_path = self.path.with_name(f"{self.path.stem}.attempts.jsonl")
+        self._sessions_path = self.path.with_name(f"{self.path.stem}.sessions.jsonl")
+        self._lock_path = self.path.with_name(f"{self.path.stem}.lock")
+
+    @classmethod
+    def load(cls, path="progress.json") -> Dict[str, Any]:
+        """Read-only view of the history at 'path' (snapshot plus logs).
+
+        Unlike constructing a JsonMemory, this creates, locks and rewrites nothing, and nothing is left to close at exit.
+        """
+        mem = cls.__new__(cls)
+        mem._set_paths(path)
+        mem._gen = 0
+        mem._reset()
+        if mem._attempts_path.exists() or mem._sessions_path.exists():
+            mem._replay(repair=False)
+        elif mem.path.exists():
+            mem._apply_export(mem._load_export())
+        mem._sync_topics()
+        return mem._data
+
+    def _reset(self) -> None:
+        self._data: Dict[str, Any] = {"sessions": [], "attempts": [], "questions": {}}
+        # Running per-topic totals, derived from the logs and never exported:
+        # {topic: {"n", "correct", "sum_ratio", "score_n", "questions": {qid: [n, correct, sum_ms, ms_count, prompt]}}}
+        self._topic_stats: Dict[Any, Dict[str, Any]] = {}
+        # Topics per question id. qrec["topics"] lists are rebuilt (sorted) lazily, for changed ids only
+        self._topic_sets: Dict[str, Set[str]] = {}
+        self._topics_dirty: Set[str] = set()
+
+    def _topic(self, topic: Any) -> Dict[str, Any]:
+        ts = self._topic_stats.get(topic)
+        if ts is None:
+            ts = self._topic_stats[topic] = {"n": 0, "correct": 0, "sum_ratio": 0.0, "score_n": 0, "questions": {}}
+        return ts
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = False) -> Iterator[None]:
+        """Serialize log writes (shared) against compaction (exclusive) across processes."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_export(self) -> Dict[str, Any]:
+        """Parse progress.json; a corrupt/partial file is repaired to the entries that survive in it."""
+        try:
+            data = orjson.loads(self.path.read_bytes())
+        except orjson.JSONDecodeError:
+            return self._salvage_export()
+        except OSError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _apply_export(self, data: Dict[str, Any]) -> None:
+        sessions = data.get("sessions") if isinstance(data.get("sessions"), list) else []
+        attempts = data.get("attempts") if isinstance(data.get("attempts"), list) else []
+        for entry in sessions:
+            if isinstance(entry, dict):
+                self._apply_session(entry)
+        for entry in attempts:
+            if isinstance(entry, dict):
+                self._apply_attempt(entry)
+
+    def _import_export(self) -> None:
+        """Start the logs from an existing progress.json (a snapshot, or an export from an older version)."""
+        data = self._load_export()
+        self._apply_export(data)
+        gen = data.get("wal_gen")
+        if isinstance(gen, int):
+            self._gen = gen
         else:
-            # Ensure required keys exist for forward compatibility; repair corrupt files
+            # Make the export a snapshot first, so the fresh logs never duplicate its entries
+            self._gen = 1
+            self._write_snapshot()
+        self._start_logs()
+
+    def _salvage_export(self) -> Dict[str, Any]:
+        """Stream the complete 'sessions'/'attempts' entries out of an unparseable export, up to the damage.
+
+        A snapshot starts with "wal_gen", so a cut-off one still says which logs it covers.
+        """
+        data: Dict[str, Any] = {"sessions": [], "attempts": []}
+        try:
+            with open(self.path, "rb") as f:
+                gen = next(ijson.items(f, "wal_gen"), None)
+            if isinstance(gen, int):
+                data["wal_gen"] = gen
+        except Exception:
+            pass
+        for key in ("sessions", "attempts"):
             try:
-                data = self._read()
+                with open(self.path, "rb") as f:
+                    for entry in ijson.items(f, f"{key}.item", use_float=True):
+                        data[key].append(entry)
             except Exception:
-                # Reinitialize corrupt/empty file
-                data = {"sessions": [], "attempts": [], "questions": {}}
-                self._write(data)
-            changed = False
-            if not isinstance(data, dict):
-                data = {"sessions": [], "attempts": [], "questions": {}}
-                changed = True
-            if "sessions" not in data or not isinstance(data["sessions"], list):
-                data["sessions"] = []
-                changed = True
-            if "attempts" not in data or not isinstance(data["attempts"], list):
-                data["attempts"] = []
-                changed = True
-            if "questions" not in data or not isinstance(data["questions"], dict):
-                data["questions"] = {}
-                changed = True
-            if changed:
-                self._write(data)
+                pass  # stop at the first malformed or truncated token; keep what came before
+        return data
+
+    def _replay(self, repair: bool = True) -> None:
+        self._gen = 0
+        if self.path.exists():
+            data = self._load_export()
+            if isinstance(data.get("wal_gen"), int):
+                self._gen = data["wal_gen"]
+                self._apply_export(data)
+            # otherwise it is an export from before snapshots existed; the logs hold everything
+        stale = False
+        for log_path, apply in (
+            (self._sessions_path, self._apply_session),
+            (self._attempts_path, self._apply_attempt),
+        ):
+            if not log_path.exists():
+                continue
+            with open(log_path, "rb") as f:
+                for n, line in enumerate(f):
+                    try:
+                        entry = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        continue  # blank or torn line from an interrupted write
+                    if not isinstance(entry, dict):
+                        continue
+                    if n == 0:
+                        log_gen = entry.get("wal_gen", 0)
+                        if log_gen < self._gen:
+                            # Left over from a compaction interrupted after its snapshot was written
+                            stale = True
+                            break
+                        if "wal_gen" in entry:
+                            continue
+                    apply(entry)
+        if stale and repair:
+            self._start_logs()
+
+    def _start_logs(self) -> None:
+        """Truncate both logs to just a header for the current generation."""
+        header = orjson.dumps({"wal_gen": self._gen}) + b"\n"
+        for log_path in (self._sessions_path, self._attempts_path):
+            with open(log_path, "wb") as f:
+                f.write(header)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _trim_torn_tail(self, log_path: Path) -> None:
+        """Cut off a partial last line left by a crash, so the next append starts on a line of its own.
+
+        Only safe under the exclusive lock: under the shared one, a partial line may be another
+        process's write in progress.
+        """
+        if not log_path.exists():
+            return
+        with open(log_path, "r+b") as f:
+            end = pos = f.seek(0, os.SEEK_END)
+            while pos > 0:
+                step = min(pos, 1 << 12)
+                f.seek(pos - step)
+                nl = f.read(step).rfind(b"\n")
+                if nl >= 0:
+                    pos += nl + 1 - step
+                    break
+                pos -= step
+            if pos == end:
+                return
+            f.truncate(pos)
+            if pos == 0:
+                # Even the header was torn: write it again, or the next entries would look stale
+                f.write(orjson.dumps({"wal_gen": self._gen}) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _log_stamp(self) -> Tuple[Tuple[int, int], ...]:
+        """(mtime_ns, size) of the sessions log, the attempts log and the snapshot."""
+        stamps = []
+        for p in (self._sessions_path, self._attempts_path, self.path):
+            try:
+                st = p.stat()
+                stamps.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamps.append((0, 0))
+        return tuple(stamps)
 
     def _read(self) -> Dict[str, Any]:
-        return json.loads(self.path.read_text(encoding="utf-8"))
+        if self._closed:
+            return self._data
+        with self._file_lock():
+            self._sync()
+        self._sync_topics()
+        return self._data
+
+    def _sync(self) -> None:
+        """Write out buffered entries, then reload if another process appended or compacted."""
+        self._sessions_fp.flush()
+        self._attempts_fp.flush()
+        stamp = self._log_stamp()
+        if stamp != self._stamp:
+            if [size for _, size in stamp[:2]] != self._sizes or stamp[2] != self._stamp[2]:
+                self._reset()
+                self._replay()
+            self._stamp = stamp
+            self._sizes = [size for _, size in stamp[:2]]
+
+    def _sync_topics(self) -> None:
+        questions = self._data["questions"]
+        for qid in self._topics_dirty:
+            questions[qid]["topics"] = sorted(self._topic_sets[qid])
+        self._topics_dirty.clear()
+
+    def _append(self, which: int, entry: Dict[str, Any]) -> None:
+        """Log 'entry' and apply it in memory; only then may a flush (and a compaction) run."""
+        line = orjson.dumps(entry) + b"\n"
+        (self._sessions_fp, self._attempts_fp)[which].write(line)
+        self._sizes[which] += len(line)
+        # Applied before any flush: a compaction snapshots _data and truncates the logs, so the
+        # entry must already be in _data by then
+        (self._apply_session, self._apply_attempt)[which](entry)
+        self._dirty += 1
+        self._unsnapshotted += 1
+        if self._dirty >= _FLUSH_EVERY or time.monotonic() - self._last_flush > _FLUSH_INTERVAL_S:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered log entries through to disk; compact once the logs outgrow _COMPACT_BYTES."""
+        if self._closed:
+            return
+        with self._file_lock():
+            for fp in (self._sessions_fp, self._attempts_fp):
+                fp.flush()
+                os.fsync(fp.fileno())
+        self._dirty = 0
+        self._last_flush = time.monotonic()
+        if sum(self._sizes) > _COMPACT_BYTES:
+            self.compact()
+
+    def compact(self) -> None:
+        """Fold the logs into a new progress.json snapshot and truncate them."""
+        with self._file_lock(exclusive=True):
+            # Pick up other processes' entries first, so truncating the logs cannot drop them
+            self._sync()
+            self._gen += 1
+            self._write_snapshot()
+            self._start_logs()
+            self._stamp = self._log_stamp()
+            self._sizes = [size for _, size in self._stamp[:2]]
+        self._unsnapshotted = 0
+
+    def _write_snapshot(self) -> None:
+        self._sync_topics()
+        # "wal_gen" goes first so that it survives in a truncated snapshot (see _salvage_export)
+        self._write({"wal_gen": self._gen, **self._data})
 
     def _write(self, data: Dict[str, Any]) -> None:
-        self.path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        # Durable before it returns: compact() empties the logs right after, trusting the snapshot is on disk
+        atomic_write_bytes(self.path, orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+    def close(self) -> None:
+        """Flush the logs and, if this instance appended anything, write a final progress.json snapshot."""
+        if self._closed:
+            return
+        self.flush()
+        if self._unsnapshotted:
+            self.compact()
+        self._closed = True
+        _open_memories.discard(self)
+        self._attempts_fp.close()
+        self._sessions_fp.close()
 
     # ----- Session Logging -----
     def log_session(self, topic: str, score: float, details: dict):
-        data = self._read()
-        data.setdefault("sessions", [])
-        data["sessions"].append({
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+        entry = {
+            "timestamp": _now_iso(),
             "topic": topic,
             "score": score,
             "details": details
-        })
-        self._write(data)
+        }
+        self._append(0, entry)
+
+    def _apply_session(self, entry: Dict[str, Any]) -> None:
+        self._data["sessions"].append(entry)
+        try:
+            ratio = float(entry.get("score", 0.0)) / 100.0
+        except Exception:
+            return
+        ts = self._topic(entry.get("topic"))
+        ts["sum_ratio"] += ratio
+        ts["score_n"] += 1
 
     # ----- Question Attempts -----
     @staticmethod
+    @lru_cache(maxsize=4096)
     def question_id(prompt: str) -> str:
-        """Stable ID for a question prompt using normalized SHA-256 (shortened)."""
-        normalized = " ".join(prompt.strip().split()).lower()
-        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+        """Stable ID for a question prompt: 8-byte BLAKE2b of the normalized prompt, as 16 hex chars."""
+        # Memoized: the same prompts recur across attempts and log replays
+        normalized = _WS.sub(" ", prompt.strip()).lower()
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8, usedforsecurity=False).hexdigest()
 
     def log_attempt(
         self,
@@ -66,17 +398,10 @@ class JsonMemory:
         correct: bool,
         response_ms: Optional[int] = None,
     ) -> None:
-        data = self._read()
-        data.setdefault("attempts", [])
-        data.setdefault("questions", {})
-
-        qid = self.question_id(prompt)
-        ts = datetime.utcnow().isoformat() + "Z"
-
         attempt_entry = {
-            "timestamp": ts,
+            "timestamp": _now_iso(),
             "topic": topic,
-            "question_id": qid,
+            "question_id": self.question_id(prompt),
             "prompt": prompt,
             "student_answer": student_answer,
             "correct": correct,
@@ -85,8 +410,35 @@ class JsonMemory:
             attempt_entry["response_ms"] = int(response_ms)
 
         # Append attempt entry
+        self._append(1, attempt_entry)
+
+    def _apply_attempt(self, attempt_entry: Dict[str, Any]) -> None:
+        """Add an attempt to the in-memory history and update its questions aggregate."""
+        data = self._data
         data["attempts"].append(attempt_entry)
 
+        prompt = attempt_entry.get("prompt", "")
+        qid = self.question_id(prompt)
+        if attempt_entry.get("question_id") and attempt_entry["question_id"] != qid:
+            # Logged under an older id scheme (truncated SHA-256): rekey on replay
+            attempt_entry["question_id"] = qid
+        topic = attempt_entry.get("topic")
+        response_ms = attempt_entry.get("response_ms")
+
+        ts = self._topic(topic)
+        is_correct = attempt_entry.get("correct") is True
+        ts["n"] += 1
+        ts["correct"] += is_correct
+        if attempt_entry.get("question_id"):
+            s = ts["questions"].get(qid)
+            if s is None:
+                s = ts["questions"][qid] = [0, 0, 0, 0, prompt]
+            s[0] += 1
+            s[1] += is_correct
+            if isinstance(response_ms, int):
+                s[2] += response_ms
+                s[3] += 1
+
         # Update questions aggregate
         qrec = data["questions"].get(qid, {
             "prompt": prompt,
@@ -100,12 +452,14 @@ class JsonMemory:
         })
         prev_n = int(qrec.get("times_asked", 0))
         qrec["times_asked"] = prev_n + 1
-        qrec["last_answer"] = student_answer
-        qrec["last_correct"] = bool(correct)
-        qrec["last_timestamp"] = ts
-        topics = set(qrec.get("topics", []))
-        topics.add(topic)
-        qrec["topics"] = sorted(topics)
+        qrec["last_answer"] = attempt_entry.get("student_answer")
+        qrec["last_correct"] = bool(attempt_entry.get("correct"))
+        qrec["last_timestamp"] = attempt_entry.get("timestamp")
+        if topic is not None:
+            topics = self._topic_sets.setdefault(qid, set())
+            if topic not in topics:
+                topics.add(topic)
+                self._topics_dirty.add(qid)
 
         if response_ms is not None:
             ms = int(response_ms)
@@ -118,44 +472,42 @@ class JsonMemory:
 
         data["questions"][qid] = qrec
 
-        self._write(data)
-
-    def get_excluded_prompts(self, mode: str = "all", topic: Optional[str] = None) -> List[str]:
+    def get_excluded_prompts(
+        self, mode: str = "all", topic: Optional[str] = None, limit: Optional[int] = None
+    ) -> List[str]:
         """Return prompts to exclude. mode: 'all' (default) or 'correct'.
         If topic is provided, only consider prompts associated with that topic.
+        If limit is provided, stop after that many prompts (oldest first).
         """
         data = self._read()
         questions = data.get("questions", {})
-        def topic_match(rec: Dict[str, Any]) -> bool:
-            if topic is None:
-                return True
-            rec_topics = rec.get("topics", [])
-            return isinstance(rec_topics, list) and topic in rec_topics
-        if mode == "correct":
-            return [rec.get("prompt", "") for rec in questions.values() if rec.get("last_correct") is True and topic_match(rec)]
-        # default: all previously asked prompts
-        return [rec.get("prompt", "") for rec in questions.values() if topic_match(rec)]
+        topic_sets = self._topic_sets
+        out: List[str] = []
+        if limit is not None and limit <= 0:
+            return out
+        for qid, rec in questions.items():
+            # default: all previously asked prompts
+            if mode == "correct" and rec.get("last_correct") is not True:
+                continue
+            if topic is not None and topic not in topic_sets.get(qid, ()):
+                continue
+            out.append(rec.get("prompt", ""))
+            if limit is not None and len(out) >= limit:
+                break
+        return out
 
     # ----- Adaptive Difficulty -----
     def get_topic_accuracy(self, topic: str, default: float = 0.7) -> float:
         """Return accuracy (0-1) for a topic based on attempts; falls back to session scores."""
-        data = self._read()
-        attempts = [a for a in data.get("attempts", []) if a.get("topic") == topic]
-        if attempts:
-            total = len(attempts)
-            correct = sum(1 for a in attempts if a.get("correct") is True)
-            return correct / total if total else default
+        self._read()
+        ts = self._topic_stats.get(topic)
+        if ts is None:
+            return default
+        if ts["n"]:
+            return ts["correct"] / ts["n"]
         # Fallback to sessions
-        sessions = [s for s in data.get("sessions", []) if s.get("topic") == topic]
-        if sessions:
-            ratios = []
-            for s in sessions:
-                try:
-                    ratios.append(float(s.get("score", 0.0)) / 100.0)
-                except Exception:
-                    continue
-            if ratios:
-                return sum(ratios) / len(ratios)
+        if ts["score_n"]:
+            return ts["sum_ratio"] / ts["score_n"]
         return default
 
     def get_adaptive_difficulty(self, topic: str) -> str:
@@ -172,38 +524,26 @@ class JsonMemory:
         """Return up to 'limit' questions for the topic with the highest error rates.
         Each item: {prompt, attempts, correct, incorrect, error_rate, avg_response_ms}
         """
-        data = self._read()
-        attempts = [a for a in data.get("attempts", []) if a.get("topic") == topic]
-        if not attempts:
+        self._read()
+        ts = self._topic_stats.get(topic)
+        if ts is None:
             return []
-        stats: Dict[str, Dict[str, Any]] = {}
-        for a in attempts:
-            qid = a.get("question_id")
-            if not qid:
-                continue
-            st = stats.setdefault(qid, {"prompt": a.get("prompt", ""), "attempts": 0, "correct": 0, "incorrect": 0, "sum_ms": 0, "ms_count": 0})
-            st["attempts"] += 1
-            if a.get("correct") is True:
-                st["correct"] += 1
-            else:
-                st["incorrect"] += 1
-            if isinstance(a.get("response_ms"), int):
-                st["sum_ms"] += a["response_ms"]
-                st["ms_count"] += 1
-        # compute error rate and avg ms
-        items: List[Dict[str, Any]] = []
-        for qid, st in stats.items():
-            if st["attempts"] < min_attempts or st["incorrect"] == 0:
+        # Rank on plain tuples: (error_rate, attempts, avg_ms or 0, -position) is compared directly,
+        # -position keeps first-seen order among ties, and dicts are only built for the top 'limit'
+        rows = []
+        for pos, (n, n_correct, sum_ms, n_ms, prompt) in enumerate(ts["questions"].values()):
+            if n < min_attempts or n == n_correct:
                 continue
-            avg_ms = int(round(st["sum_ms"] / st["ms_count"])) if st["ms_count"] > 0 else None
-            error_rate = st["incorrect"] / st["attempts"]
-            items.append({
-                "prompt": st["prompt"],
-                "attempts": st["attempts"],
-                "correct": st["correct"],
-                "incorrect": st["incorrect"],
+            avg_ms = int(round(sum_ms / n_ms)) if n_ms > 0 else None
+            rows.append(((n - n_correct) / n, n, avg_ms or 0, -pos, n_correct, avg_ms, prompt))
+        return [
+            {
+                "prompt": prompt,
+                "attempts": n,
+                "correct": n_correct,
+                "incorrect": n - n_correct,
                 "error_rate": error_rate,
                 "avg_response_ms": avg_ms,
-            })
-        items.sort(key=lambda x: (x["error_rate"], x["attempts"], (x["avg_response_ms"] or 0)), reverse=True)
-        return items[:limit]
\ No newline at end of file
+            }
+            for error_rate, n, _, _, n_correct, avg_ms, prompt in heapq.nlargest(limit, rows, key=_RANK)
+        ]
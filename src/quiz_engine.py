@@ -1,8 +1,10 @@
 from __future__ import annotations
 
-import json
+from functools import lru_cache
 from typing import Any, Dict, List, Literal, TypedDict, Union, Optional
 
+import httpx
+import orjson
 from langchain_openai import ChatOpenAI
 from .config import OPENAI_MODEL
 
@@ -40,22 +42,23 @@ SYS_PROMPT = (
 )
 
 
+# At most this many previously asked prompts are listed in the generation prompt
+MAX_EXCLUDED_PROMPTS = 50
+
+
 # ---- Helpers ------------------------------------------------------------
 
-def _safe_json_loads(payload: str) -> Dict[str, Any]:
-    """Parse JSON safely; if it fails, try to extract the first JSON object or raise."""
-    try:
-        return json.loads(payload)
-    except json.JSONDecodeError:
-        # naive recovery: find first '{' and last '}' and try again
-        start = payload.find("{")
-        end = payload.rfind("}")
-        if 0 <= start < end:
-            try:
-                return json.loads(payload[start : end + 1])
-            except json.JSONDecodeError:
-                pass
-        raise
+@lru_cache(maxsize=1)
+def _get_llm() -> ChatOpenAI:
+    """Return the shared quiz-generation client, so keep-alive connections survive across quizzes."""
+    return ChatOpenAI(
+        model=OPENAI_MODEL,
+        temperature=0.2,
+        model_kwargs={"response_format": {"type": "json_object"}},
+        max_retries=2,
+        timeout=30,
+        http_client=httpx.Client(limits=httpx.Limits(max_keepalive_connections=4)),
+    )
 
 
 def _validate_quiz_schema(obj: Dict[str, Any]) -> Quiz:
@@ -89,11 +92,12 @@ def generate_quiz(
     excluded_prompts: optional list of prompt strings that must not be repeated.
     difficulty: optional hint among {'easy','medium','hard'}.
     """
-    llm = ChatOpenAI(model=OPENAI_MODEL, temperature=0.2)
+    llm = _get_llm()
 
     avoidance_instructions = ""
     if excluded_prompts:
-        avoided = "\n".join(f"- {p}" for p in excluded_prompts[:50])
+        unique = list(dict.fromkeys(excluded_prompts))[:MAX_EXCLUDED_PROMPTS]
+        avoided = "\n".join(f"- {p}" for p in unique)
         avoidance_instructions = (
             "\nDo NOT repeat any of the following previously asked prompts. "
             "If a prompt is similar, create a clearly different question.\n"
@@ -128,7 +132,7 @@ def generate_quiz(
     ])
 
     try:
-        data = _safe_json_loads(resp.content)
+        data = orjson.loads(resp.content)
         return _validate_quiz_schema(data)
     except Exception:
         return {"questions": []}
\ No newline at end of file
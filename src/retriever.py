@@ -1,14 +1,59 @@
-from typing import List
+import asyncio
+import hashlib
+import os
+import shelve
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks
+    fcntl = None
+
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
 from .config import EMBEDDING_MODEL
+from .ingest_cache import IngestManifest
+
+# Chunks per embeddings request / Chroma write, and embeddings requests in flight at once
+EMBED_BATCH = 256
+EMBED_CONCURRENCY = 4
+
+# Retrieved contexts keyed by (topic hash, k, vector store fingerprint), shared across processes
+RETRIEVER_CACHE = "cache/retriever"
+# In-process LRU in front of it, keyed the same way (not on the vector store handle)
+_MEMO_SIZE = 256
+_memo: "OrderedDict[str, str]" = OrderedDict()
+_memo_lock = threading.Lock()
 
 
-def build_or_load_vectorstore(chunks: List[Document], persist_dir: str = "vectorstore"):
-    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+def build_or_load_vectorstore(
+    chunks: List[Document],
+    persist_dir: str = "vectorstore",
+    manifest: Optional[IngestManifest] = None,
+):
+    """Build/load the vector store.
+
+    With a manifest, 'chunks' are only those of new/changed files: their old chunks are replaced
+    by id and chunks of deleted files are dropped, instead of re-embedding every note.
+    """
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, chunk_size=1024, show_progress_bar=False)
+    if manifest is not None:
+        vs = Chroma(embedding_function=embeddings, persist_directory=persist_dir)
+        if manifest.is_new:
+            # Chunks added before the manifest existed have no known ids; start from a clean collection
+            vs.delete_collection()
+            vs = Chroma(embedding_function=embeddings, persist_directory=persist_dir)
+        _sync_vectorstore(vs, embeddings, chunks, manifest)
+        return vs
     if chunks:
-        vs = Chroma.from_documents(documents=chunks, embedding=embeddings, persist_directory=persist_dir)
+        vs = Chroma(embedding_function=embeddings, persist_directory=persist_dir)
+        _add_documents(vs, embeddings, chunks, [str(uuid.uuid4()) for _ in chunks])
         try:
             vs.persist()
         except Exception:
@@ -18,6 +63,122 @@ def build_or_load_vectorstore(chunks: List[Document], persist_dir: str = "vector
     return Chroma(embedding_function=embeddings, persist_directory=persist_dir)
 
 
-def retrieve_context(vs, topic: str, k: int = 6) -> str:
-    results = vs.similarity_search(topic, k=k)
-    return "\n\n".join([r.page_content for r in results])
\ No newline at end of file
+def _chunked(items: List, size: int) -> Iterator[List]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+async def _aembed_batches(embeddings, batches: List[List[str]]) -> List[List[List[float]]]:
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def one(texts: List[str]) -> List[List[float]]:
+        async with sem:
+            return await embeddings.aembed_documents(texts)
+
+    return await asyncio.gather(*(one(b) for b in batches))
+
+
+def _add_documents(vs, embeddings, docs: List[Document], ids: List[str]) -> None:
+    """Embed 'docs' with concurrent batched requests, then write the vectors straight to the collection."""
+    if not docs:
+        return
+    doc_batches = list(_chunked(docs, EMBED_BATCH))
+    vectors = asyncio.run(_aembed_batches(embeddings, [[d.page_content for d in b] for b in doc_batches]))
+    for batch, batch_ids, batch_vectors in zip(doc_batches, _chunked(ids, EMBED_BATCH), vectors):
+        vs._collection.upsert(
+            ids=batch_ids,
+            embeddings=batch_vectors,
+            documents=[d.page_content for d in batch],
+            metadatas=[d.metadata for d in batch],
+        )
+
+
+def _sync_vectorstore(vs, embeddings, chunks: List[Document], manifest: IngestManifest) -> None:
+    changed = manifest.pending()
+    removed = manifest.removed()
+    stale = [cid for path in changed + removed for cid in manifest.chunk_ids(path)]
+    if stale:
+        vs.delete(ids=stale)
+    by_source: Dict[str, List[Document]] = defaultdict(list)
+    for c in chunks:
+        by_source[c.metadata.get("source", "")].append(c)
+    # Embed all changed files together so small notes share requests
+    new_docs: List[Document] = []
+    new_ids: List[str] = []
+    file_ids: Dict[str, List[str]] = {}
+    for path in changed:
+        docs = by_source.get(path, [])
+        file_ids[path] = manifest.new_chunk_ids(path, len(docs))
+        new_docs.extend(docs)
+        new_ids.extend(file_ids[path])
+    _add_documents(vs, embeddings, new_docs, new_ids)
+    for path in changed:
+        manifest.record(path, file_ids[path])
+    for path in removed:
+        manifest.forget(path)
+    manifest.save()
+
+
+def _store_fingerprint(persist_dir: str) -> str:
+    """Changes whenever the persisted store is written (Chroma keeps its files at the top level)."""
+    try:
+        stamps = sorted((e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in os.scandir(persist_dir))
+    except FileNotFoundError:
+        return ""
+    return hashlib.sha256(repr(stamps).encode("utf-8")).hexdigest()[:16]
+
+
+@contextmanager
+def _shelf(exclusive: bool) -> Iterator[shelve.Shelf]:
+    """Open the on-disk cache under an advisory lock shared with other processes (app, CLI)."""
+    Path(RETRIEVER_CACHE).parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{RETRIEVER_CACHE}.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            with shelve.open(RETRIEVER_CACHE, flag="c" if exclusive else "r") as db:
+                yield db
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _disk_get(key: str) -> Optional[str]:
+    try:
+        with _shelf(exclusive=False) as db:
+            return db.get(key)
+    except Exception:
+        return None  # missing or unreadable cache: treat as a miss
+
+
+def _disk_put(key: str, fingerprint: str, context: str) -> None:
+    try:
+        with _shelf(exclusive=True) as db:
+            # Entries for earlier versions of the store can never be hit again
+            for stale in [sk for sk in db.keys() if not sk.endswith(fingerprint)]:
+                del db[stale]
+            db[key] = context
+    except Exception:
+        pass  # caching is best-effort
+
+
+def retrieve_context(vs, topic: str, k: int = 6, persist_dir: str = "vectorstore") -> str:
+    """Top-k note chunks for 'topic', reused until the vector store in 'persist_dir' changes."""
+    fingerprint = _store_fingerprint(persist_dir)
+    key = f"{hashlib.sha256(topic.encode('utf-8')).hexdigest()}|{k}|{fingerprint}"
+    with _memo_lock:
+        context = _memo.get(key)
+        if context is not None:
+            _memo.move_to_end(key)
+            return context
+    context = _disk_get(key)
+    if context is None:
+        # Blank chunks (e.g. image-only PDF pages) would only add separators to the prompt
+        pages = [text for text in (r.page_content for r in vs.similarity_search(topic, k=k)) if text and text.strip()]
+        context = "\n\n".join(pages)
+        _disk_put(key, fingerprint, context)
+    with _memo_lock:
+        _memo[key] = context
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return context
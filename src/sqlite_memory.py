@@ -0,0 +1,290 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+from .memory import JsonMemory, _now_iso
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    student_answer TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    response_ms INTEGER
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    score REAL NOT NULL,
+    details_json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    question_id TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    times_asked INTEGER NOT NULL,
+    last_correct INTEGER NOT NULL,
+    last_answer TEXT NOT NULL,
+    last_ts TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS question_topics (
+    question_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    PRIMARY KEY (question_id, topic)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attempts_topic_qid ON attempts (topic, question_id);
+CREATE INDEX IF NOT EXISTS sessions_topic ON sessions (topic);
+CREATE INDEX IF NOT EXISTS question_topics_topic ON question_topics (topic, question_id);
+"""
+
+# Rebuilds the per-question aggregate from the attempts table (first prompt seen, latest result)
+_BACKFILL_QUESTIONS = """
+DELETE FROM questions;
+DELETE FROM question_topics;
+INSERT INTO questions (question_id, prompt, times_asked, last_correct, last_answer, last_ts)
+SELECT q.question_id, f.prompt, q.n, l.correct, l.student_answer, l.ts
+FROM (
+    SELECT question_id, MIN(id) AS first_id, MAX(id) AS last_id, COUNT(*) AS n
+    FROM attempts GROUP BY question_id
+) q
+JOIN attempts f ON f.id = q.first_id
+JOIN attempts l ON l.id = q.last_id
+ORDER BY q.first_id;
+INSERT INTO question_topics (question_id, topic) SELECT DISTINCT question_id, topic FROM attempts;
+"""
+
+# 1: questions/question_topics tables. 2: question_id is BLAKE2b instead of truncated SHA-256.
+_SCHEMA_VERSION = 2
+
+
+class SqliteMemory:
+    """Progress store with the same interface as JsonMemory, backed by SQLite in WAL mode.
+
+    Appends are single INSERTs instead of a rewrite of the whole history, and WAL lets several
+    Streamlit sessions read while one writes. On first use, history from 'legacy_json' is imported.
+    """
+
+    def __init__(self, path="progress.db", legacy_json: Optional[str] = "progress.json"):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        # Streamlit reruns a session's script on different threads; access is serialized by _lock
+        self._conn = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        if legacy_json and Path(legacy_json).exists():
+            self._import_legacy(legacy_json)
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < _SCHEMA_VERSION:
+            self._migrate(version)
+
+    def _backfill_questions(self) -> None:
+        for stmt in _BACKFILL_QUESTIONS.split(";"):
+            if stmt.strip():
+                self._conn.execute(stmt)
+
+    def _migrate(self, version: int) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if version < 2:
+                    self._conn.create_function("question_id", 1, JsonMemory.question_id, deterministic=True)
+                    self._conn.execute("UPDATE attempts SET question_id = question_id(prompt)")
+                # Rebuild the per-question aggregate (created in version 1) under the current ids
+                self._backfill_questions()
+                self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _import_legacy(self, legacy_json: str) -> None:
+        with self._lock:
+            has_rows = self._conn.execute(
+                "SELECT EXISTS(SELECT 1 FROM attempts) OR EXISTS(SELECT 1 FROM sessions)"
+            ).fetchone()[0]
+        if has_rows:
+            return
+        data = JsonMemory.load(legacy_json)
+        if not data["attempts"] and not data["sessions"]:
+            return
+        attempts = [
+            (
+                a.get("timestamp", ""),
+                a.get("topic", ""),
+                JsonMemory.question_id(a.get("prompt", "")),
+                a.get("prompt", ""),
+                a.get("student_answer", ""),
+                int(a.get("correct") is True),
+                a["response_ms"] if isinstance(a.get("response_ms"), int) else None,
+            )
+            for a in data.get("attempts", [])
+        ]
+        sessions = [
+            (
+                s.get("timestamp", ""),
+                s.get("topic", ""),
+                float(s.get("score", 0.0) or 0.0),
+                orjson.dumps(s.get("details", {})).decode("utf-8"),
+            )
+            for s in data.get("sessions", [])
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO attempts (ts, topic, question_id, prompt, student_answer, correct, response_ms) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    attempts,
+                )
+                self._conn.executemany(
+                    "INSERT INTO sessions (ts, topic, score, details_json) VALUES (?, ?, ?, ?)",
+                    sessions,
+                )
+                self._backfill_questions()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ----- Session Logging -----
+    def log_session(self, topic: str, score: float, details: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (ts, topic, score, details_json) VALUES (?, ?, ?, ?)",
+                (_now_iso(), topic, float(score), orjson.dumps(details).decode("utf-8")),
+            )
+
+    def get_sessions(self) -> List[Dict[str, Any]]:
+        """All sessions, oldest first, in the same shape as JsonMemory's 'sessions' list."""
+        with self._lock:
+            rows = self._conn.execute("SELECT ts, topic, score, details_json FROM sessions ORDER BY id").fetchall()
+        return [
+            {"timestamp": r["ts"], "topic": r["topic"], "score": r["score"], "details": orjson.loads(r["details_json"])}
+            for r in rows
+        ]
+
+    # ----- Question Attempts -----
+    question_id = staticmethod(JsonMemory.question_id)
+
+    def log_attempt(
+        self,
+        topic: str,
+        prompt: str,
+        student_answer: str,
+        correct: bool,
+        response_ms: Optional[int] = None,
+    ) -> None:
+        qid = self.question_id(prompt)
+        ts = _now_iso()
+        ok = int(bool(correct))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO attempts (ts, topic, question_id, prompt, student_answer, correct, response_ms) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (ts, topic, qid, prompt, student_answer, ok, int(response_ms) if response_ms is not None else None),
+                )
+                self._conn.execute(
+                    "INSERT INTO questions (question_id, prompt, times_asked, last_correct, last_answer, last_ts) "
+                    "VALUES (?, ?, 1, ?, ?, ?) "
+                    "ON CONFLICT(question_id) DO UPDATE SET times_asked = times_asked + 1, "
+                    "last_correct = excluded.last_correct, last_answer = excluded.last_answer, last_ts = excluded.last_ts",
+                    (qid, prompt, ok, student_answer, ts),
+                )
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO question_topics (question_id, topic) VALUES (?, ?)", (qid, topic)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_excluded_prompts(
+        self, mode: str = "all", topic: Optional[str] = None, limit: Optional[int] = None
+    ) -> List[str]:
+        """Return prompts to exclude. mode: 'all' (default) or 'correct'.
+        If topic is provided, only consider prompts associated with that topic.
+        If limit is provided, stop after that many prompts (oldest first).
+        """
+        # Served from the questions aggregate; topic membership is an index lookup
+        sql = """
+            SELECT q.prompt FROM questions q
+            WHERE (:only_correct = 0 OR q.last_correct = 1)
+              AND (:topic IS NULL OR EXISTS (
+                  SELECT 1 FROM question_topics t WHERE t.question_id = q.question_id AND t.topic = :topic
+              ))
+            ORDER BY q.rowid
+            LIMIT :limit
+        """
+        with self._lock:
+            rows = self._conn.execute(sql, {"topic": topic, "only_correct": int(mode == "correct"), "limit": -1 if limit is None else max(limit, 0)}).fetchall()
+        return [r[0] for r in rows]
+
+    # ----- Adaptive Difficulty -----
+    def get_topic_accuracy(self, topic: str, default: float = 0.7) -> float:
+        """Return accuracy (0-1) for a topic based on attempts; falls back to session scores."""
+        with self._lock:
+            total, correct = self._conn.execute(
+                "SELECT COUNT(*), SUM(correct) FROM attempts WHERE topic = ?", (topic,)
+            ).fetchone()
+            if total:
+                return correct / total
+            avg_score = self._conn.execute("SELECT AVG(score) FROM sessions WHERE topic = ?", (topic,)).fetchone()[0]
+        if avg_score is not None:
+            return avg_score / 100.0
+        return default
+
+    def get_adaptive_difficulty(self, topic: str) -> str:
+        """Map topic accuracy to a difficulty label: easy/medium/hard."""
+        acc = self.get_topic_accuracy(topic)
+        if acc < 0.5:
+            return "easy"
+        if acc < 0.8:
+            return "medium"
+        return "hard"
+
+    # ----- Missed Questions Summary -----
+    def get_frequently_missed(self, topic: str, min_attempts: int = 1, limit: int = 5) -> List[Dict[str, Any]]:
+        """Return up to 'limit' questions for the topic with the highest error rates.
+        Each item: {prompt, attempts, correct, incorrect, error_rate, avg_response_ms}
+        """
+        sql = """
+            WITH s AS (
+                SELECT question_id, MIN(id) AS first_id, COUNT(*) AS n, SUM(correct) AS n_correct,
+                       SUM(response_ms) AS sum_ms, COUNT(response_ms) AS ms_count
+                FROM attempts WHERE topic = ?
+                GROUP BY question_id
+                HAVING n >= ? AND n > n_correct
+            )
+            SELECT a.prompt, s.n, s.n_correct, s.sum_ms, s.ms_count FROM s
+            JOIN attempts a ON a.id = s.first_id
+            ORDER BY 1.0 * (s.n - s.n_correct) / s.n DESC, s.n DESC,
+                     COALESCE(1.0 * s.sum_ms / NULLIF(s.ms_count, 0), 0) DESC, s.first_id
+            LIMIT ?
+        """
+        with self._lock:
+            rows = self._conn.execute(sql, (topic, min_attempts, limit)).fetchall()
+        items: List[Dict[str, Any]] = []
+        for prompt, n, n_correct, sum_ms, ms_count in rows:
+            items.append({
+                "prompt": prompt,
+                "attempts": n,
+                "correct": n_correct,
+                "incorrect": n - n_correct,
+                "error_rate": (n - n_correct) / n,
+                "avg_response_ms": int(round(sum_ms / ms_count)) if ms_count else None,
+            })
+        return items
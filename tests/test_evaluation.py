@@ -0,0 +1,32 @@
+import unittest
+
+from src.evaluation import _grade_mcq
+
+
+class GradeMcqTest(unittest.TestCase):
+    def assertGrade(self, reference, student, correct):
+        self.assertIs(_grade_mcq(reference, student)["correct"], correct, (reference, student))
+
+    def test_label_and_text_references(self):
+        self.assertGrade("B", "B) Mitochondria", True)
+        self.assertGrade("B", "A) Nucleus", False)
+        self.assertGrade("B) Mitochondria", "B) Mitochondria", True)
+        self.assertGrade("B) Mitochondria", "b", True)
+        self.assertGrade("Mitochondria", "B) mitochondria", True)
+        self.assertGrade("Mitochondria", "A) Nucleus", False)
+        self.assertGrade("B", "", False)
+
+    def test_reference_that_looks_like_a_label(self):
+        # 'E. coli' is option text, not option E
+        self.assertGrade("E. coli", "C) E. coli", True)
+        self.assertGrade("E. coli", "E) Salmonella", False)
+        self.assertGrade("C) E. coli", "C) E. coli", True)
+
+    def test_one_letter_option_text(self):
+        self.assertGrade("x", "A) x", True)
+        self.assertGrade("x", "B) y", False)
+        self.assertGrade("A", "A) x", True)
+
+
+if __name__ == "__main__":
+    unittest.main()
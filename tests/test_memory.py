@@ -0,0 +1,169 @@
+import gc
+import os
+import tempfile
+import weakref
+import unittest
+from unittest import mock
+
+from src import memory
+from src.memory import JsonMemory
+
+
+def _crash(m: JsonMemory) -> None:
+    """Drop 'm' like a killed process would: flushed log lines stay, no final snapshot is written."""
+    m._closed = True
+    m._attempts_fp.close()
+    m._sessions_fp.close()
+
+
+class CompactionTest(unittest.TestCase):
+    """An append that triggers a flush + compaction must end up in the snapshot exactly once."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "progress.json")
+        # Flush on every append and compact almost immediately, as after a >2s pause between answers
+        patches = [mock.patch.object(memory, "_FLUSH_EVERY", 1), mock.patch.object(memory, "_COMPACT_BYTES", 200)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.mems = []
+        self.addCleanup(self._close)
+
+    def _close(self):
+        for m in self.mems:
+            m.close()
+        self.dir.cleanup()
+
+    def _open(self) -> JsonMemory:
+        m = JsonMemory(self.path)
+        self.mems.append(m)
+        return m
+
+    def _prompts(self, m: JsonMemory):
+        return [a["prompt"] for a in m._read()["attempts"]]
+
+    def test_compacting_append_is_kept(self):
+        a = self._open()
+        for i in range(3):
+            a.log_attempt("T", f"qa{i}", "x", False)
+        self.assertEqual(self._prompts(a), ["qa0", "qa1", "qa2"])
+        b = self._open()
+        b.log_attempt("T", "qb0", "x", True)
+        # 'a' reloads from disk after the foreign append
+        self.assertEqual(self._prompts(a), ["qa0", "qa1", "qa2", "qb0"])
+        a.close()
+        self.assertEqual(self._prompts(self._open()), ["qa0", "qa1", "qa2", "qb0"])
+
+    def test_compacting_append_after_foreign_append_is_not_duplicated(self):
+        a = self._open()
+        b = self._open()
+        a.log_attempt("T", "qa0", "x", False)
+        b.log_attempt("T", "qb0", "x", False)
+        a.log_attempt("T", "qa1", "x", False)
+        self.assertEqual(self._prompts(a), ["qa0", "qb0", "qa1"])
+        self.assertEqual(self._prompts(b), ["qa0", "qb0", "qa1"])
+        self.assertEqual(a.get_frequently_missed("T", limit=10)[0]["attempts"], 1)
+
+
+class LoadTest(unittest.TestCase):
+    def test_load_is_read_only(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "progress.json")
+            m = JsonMemory(path)
+            m.log_attempt("T", "q0", "x", True)
+            m.close()
+            m2 = JsonMemory(path)
+            m2.log_attempt("T", "q1", "x", False)
+            m2.flush()
+            before = {name: os.stat(os.path.join(d, name)).st_mtime_ns for name in os.listdir(d)}
+            data = JsonMemory.load(path)
+            self.assertEqual([a["prompt"] for a in data["attempts"]], ["q0", "q1"])
+            self.assertEqual(before, {name: os.stat(os.path.join(d, name)).st_mtime_ns for name in os.listdir(d)})
+            m2.close()
+            self.assertEqual(JsonMemory.load(os.path.join(d, "missing.json"))["attempts"], [])
+            self.assertFalse(os.path.exists(os.path.join(d, "missing.attempts.jsonl")))
+
+
+class CloseTest(unittest.TestCase):
+    def test_reader_does_not_rewrite_snapshot(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "progress.json")
+            m = JsonMemory(path)
+            m.log_attempt("T", "q0", "x", True)
+            m.close()
+            before = os.stat(path).st_mtime_ns
+            reader = JsonMemory(path)
+            self.assertEqual(reader.get_excluded_prompts(), ["q0"])
+            reader.close()
+            self.assertEqual(os.stat(path).st_mtime_ns, before)
+
+    def test_open_instance_is_not_kept_alive(self):
+        with tempfile.TemporaryDirectory() as d:
+            m = JsonMemory(os.path.join(d, "progress.json"))
+            ref = weakref.ref(m)
+            del m
+            gc.collect()
+            self.assertIsNone(ref())
+
+
+class SalvageTest(unittest.TestCase):
+    def test_truncated_snapshot_keeps_its_entries(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "progress.json")
+            m = JsonMemory(path)
+            for i in range(5):
+                m.log_attempt("T", f"q{i}", "x", True)
+            m.close()
+            m2 = JsonMemory(path)
+            m2.log_attempt("T", "q5", "x", False)
+            m2.flush()
+            _crash(m2)
+            # Cut the snapshot off right after its attempts list, as a torn copy or a full disk would
+            with open(path, "rb") as f:
+                raw = f.read()
+            with open(path, "wb") as f:
+                f.write(raw[: raw.index(b'"questions"')])
+            expected = [f"q{i}" for i in range(6)]
+            self.assertEqual([a["prompt"] for a in JsonMemory.load(path)["attempts"]], expected)
+            m3 = JsonMemory(path)
+            self.assertEqual([a["prompt"] for a in m3._read()["attempts"]], expected)
+            m3.close()
+            self.assertEqual([a["prompt"] for a in JsonMemory.load(path)["attempts"]], expected)
+
+
+class TornLineTest(unittest.TestCase):
+    def test_append_after_torn_line_is_replayed(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "progress.json")
+            m = JsonMemory(path)
+            m.log_attempt("T", "q0", "x", True)
+            m.flush()
+            _crash(m)
+            # A crash mid-write leaves a partial last line without its newline
+            with open(os.path.join(d, "progress.attempts.jsonl"), "ab") as f:
+                f.write(b'{"timestamp": "2026')
+            m2 = JsonMemory(path)
+            m2.log_attempt("T", "q1", "x", True)
+            m2.log_attempt("T", "q2", "x", True)
+            m2.flush()
+            _crash(m2)
+            self.assertEqual([a["prompt"] for a in JsonMemory.load(path)["attempts"]], ["q0", "q1", "q2"])
+
+    def test_torn_header_is_rewritten(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "progress.json")
+            m = JsonMemory(path)
+            m.log_attempt("T", "q0", "x", True)
+            m.close()
+            with open(os.path.join(d, "progress.attempts.jsonl"), "wb") as f:
+                f.write(b'{"wal_')
+            m2 = JsonMemory(path)
+            m2.log_attempt("T", "q1", "x", True)
+            m2.flush()
+            _crash(m2)
+            self.assertEqual([a["prompt"] for a in JsonMemory.load(path)["attempts"]], ["q0", "q1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
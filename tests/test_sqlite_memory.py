@@ -0,0 +1,195 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import orjson
+
+from src.memory import JsonMemory
+from src.sqlite_memory import SqliteMemory
+
+# (topic, prompt, student_answer, correct, response_ms)
+ATTEMPTS = [
+    ("Cells", "What is the powerhouse of the cell?", "mitochondria", True, 4200),
+    ("Cells", "Name the two products of photosynthesis.", "oxygen", False, 9100),
+    ("Cells", "What does DNA stand for?", "no idea", False, None),
+    ("Genetics", "What does  DNA stand for?", "deoxyribonucleic acid", True, 3000),
+    ("Cells", "Name the two products of photosynthesis.", "glucose and oxygen", True, 5000),
+    ("Cells", "What does DNA stand for?", "dna", False, 2500),
+    ("Physics", "State Newton's second law.", "F = m/a", False, 7000),
+    ("Physics", "Convert 2.5 km to metres.", "2500", False, 7000),
+]
+SESSIONS = [("Cells", 40.0), ("Chemistry", 75.0), ("Chemistry", 25.0)]
+
+
+def _old_question_id(prompt: str) -> str:
+    """The truncated SHA-256 ids written before schema version 2."""
+    normalized = " ".join(prompt.strip().split()).lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+class SqliteMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.db = os.path.join(self.dir.name, "progress.db")
+
+    def _open(self, legacy_json=None) -> SqliteMemory:
+        mem = SqliteMemory(self.db, legacy_json=legacy_json)
+        self.addCleanup(mem.close)
+        return mem
+
+    def _assert_same_queries(self, mem, ref) -> None:
+        for topic in ("Cells", "Genetics", "Physics", "Chemistry", "Unknown"):
+            self.assertEqual(mem.get_topic_accuracy(topic), ref.get_topic_accuracy(topic), topic)
+            self.assertEqual(mem.get_adaptive_difficulty(topic), ref.get_adaptive_difficulty(topic), topic)
+            for min_attempts, limit in ((1, 5), (2, 5), (1, 1)):
+                self.assertEqual(
+                    mem.get_frequently_missed(topic, min_attempts=min_attempts, limit=limit),
+                    ref.get_frequently_missed(topic, min_attempts=min_attempts, limit=limit),
+                    (topic, min_attempts, limit),
+                )
+            for mode in ("all", "correct"):
+                self.assertEqual(
+                    mem.get_excluded_prompts(mode=mode, topic=topic), ref.get_excluded_prompts(mode=mode, topic=topic)
+                )
+        for limit in (None, 0, 2):
+            for mode in ("all", "correct"):
+                self.assertEqual(
+                    mem.get_excluded_prompts(mode=mode, limit=limit), ref.get_excluded_prompts(mode=mode, limit=limit)
+                )
+
+    def _json_reference(self) -> JsonMemory:
+        ref = JsonMemory(os.path.join(self.dir.name, "reference.json"))
+        self.addCleanup(ref.close)
+        for topic, score in SESSIONS:
+            ref.log_session(topic, score, {"n": 4})
+        for attempt in ATTEMPTS:
+            ref.log_attempt(*attempt)
+        return ref
+
+    def test_queries_match_json_memory(self):
+        mem = self._open()
+        for topic, score in SESSIONS:
+            mem.log_session(topic, score, {"n": 4})
+        for attempt in ATTEMPTS:
+            mem.log_attempt(*attempt)
+        self._assert_same_queries(mem, self._json_reference())
+        self.assertEqual(mem.get_excluded_prompts(topic="Genetics"), ["What does DNA stand for?"])
+        self.assertEqual(mem.get_topic_accuracy("Chemistry"), 0.5)
+
+    def test_imports_legacy_export(self):
+        # progress.json as written by the JSON store before SQLite: one export, old question ids
+        legacy = os.path.join(self.dir.name, "progress.json")
+        export = {
+            "sessions": [
+                {"timestamp": f"2025-01-0{n}T10:00:00", "topic": topic, "score": score, "details": {"n": 4}}
+                for n, (topic, score) in enumerate(SESSIONS, 1)
+            ],
+            "attempts": [
+                {
+                    "timestamp": f"2025-01-01T10:{n:02d}:00",
+                    "topic": topic,
+                    "question_id": _old_question_id(prompt),
+                    "prompt": prompt,
+                    "student_answer": answer,
+                    "correct": correct,
+                    **({"response_ms": ms} if ms is not None else {}),
+                }
+                for n, (topic, prompt, answer, correct, ms) in enumerate(ATTEMPTS)
+            ],
+            "questions": {},
+        }
+        with open(legacy, "wb") as f:
+            f.write(orjson.dumps(export))
+        mem = self._open(legacy_json=legacy)
+        self._assert_same_queries(mem, self._json_reference())
+        self.assertEqual(mem.get_sessions(), export["sessions"])
+        ids = {r[0] for r in mem._conn.execute("SELECT question_id FROM attempts")}
+        self.assertEqual(ids, {JsonMemory.question_id(a[1]) for a in ATTEMPTS})
+        mem.close()
+        # The import runs once: reopening does not add the history again
+        self.assertEqual(len(self._open(legacy_json=legacy).get_sessions()), len(SESSIONS))
+
+    def _write_old_database(self, version: int) -> None:
+        """A database as created at schema version 0 (attempts/sessions only) or 1 (plus questions)."""
+        conn = sqlite3.connect(self.db)
+        conn.executescript(
+            """
+            CREATE TABLE attempts (
+                id INTEGER PRIMARY KEY, ts TEXT NOT NULL, topic TEXT NOT NULL, question_id TEXT NOT NULL,
+                prompt TEXT NOT NULL, student_answer TEXT NOT NULL, correct INTEGER NOT NULL, response_ms INTEGER
+            );
+            CREATE TABLE sessions (
+                id INTEGER PRIMARY KEY, ts TEXT NOT NULL, topic TEXT NOT NULL, score REAL NOT NULL,
+                details_json TEXT NOT NULL
+            );
+            """
+        )
+        conn.executemany(
+            "INSERT INTO attempts (ts, topic, question_id, prompt, student_answer, correct, response_ms) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (f"2025-01-01T10:{n:02d}:00", topic, _old_question_id(prompt), prompt, answer, int(correct), ms)
+                for n, (topic, prompt, answer, correct, ms) in enumerate(ATTEMPTS)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO sessions (ts, topic, score, details_json) VALUES ('2025-01-01T11:00:00', ?, ?, '{}')",
+            SESSIONS,
+        )
+        if version >= 1:
+            conn.executescript(
+                """
+                CREATE TABLE questions (
+                    question_id TEXT PRIMARY KEY, prompt TEXT NOT NULL, times_asked INTEGER NOT NULL,
+                    last_correct INTEGER NOT NULL, last_answer TEXT NOT NULL, last_ts TEXT NOT NULL
+                );
+                CREATE TABLE question_topics (
+                    question_id TEXT NOT NULL, topic TEXT NOT NULL, PRIMARY KEY (question_id, topic)
+                ) WITHOUT ROWID;
+                INSERT INTO questions (question_id, prompt, times_asked, last_correct, last_answer, last_ts)
+                SELECT question_id, prompt, COUNT(*), 0, '', '' FROM attempts GROUP BY question_id;
+                INSERT INTO question_topics SELECT DISTINCT question_id, topic FROM attempts;
+                PRAGMA user_version = 1;
+                """
+            )
+        conn.commit()
+        conn.close()
+
+    def _assert_migrated(self) -> None:
+        mem = self._open()
+        self.assertEqual(mem._conn.execute("PRAGMA user_version").fetchone()[0], 2)
+        ids = [r[0] for r in mem._conn.execute("SELECT question_id FROM attempts ORDER BY id")]
+        self.assertEqual(ids, [JsonMemory.question_id(a[1]) for a in ATTEMPTS])
+        questions = {r[0]: tuple(r[1:]) for r in mem._conn.execute(
+            "SELECT question_id, prompt, times_asked, last_correct, last_answer FROM questions"
+        )}
+        self.assertEqual(
+            questions[JsonMemory.question_id("What does DNA stand for?")],
+            ("What does DNA stand for?", 3, 0, "dna"),
+        )
+        self.assertEqual(len(questions), 5)
+        self._assert_same_queries(mem, self._json_reference())
+        # New attempts land on the migrated rows, not beside them
+        mem.log_attempt("Cells", "What is the powerhouse of the cell?", "mitochondria", True)
+        self.assertEqual(
+            mem._conn.execute(
+                "SELECT times_asked FROM questions WHERE question_id = ?",
+                (JsonMemory.question_id("What is the powerhouse of the cell?"),),
+            ).fetchone()[0],
+            2,
+        )
+
+    def test_migrates_version_0(self):
+        self._write_old_database(0)
+        self._assert_migrated()
+
+    def test_migrates_version_1(self):
+        self._write_old_database(1)
+        self._assert_migrated()
+
+
+if __name__ == "__main__":
+    unittest.main()